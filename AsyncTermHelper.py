@@ -0,0 +1,350 @@
+import asyncio
+import functools
+import inspect
+import sys
+import time
+import traceback
+from CmdLineIface import parse_cmdline
+from TermHelperMin import BaseTerm, ShellCmd, DictCmdShell, split_background
+
+
+class AsyncBaseTerm(object):
+    async def out_ln(self, *args):
+        await self.write(" ".join(map(str, args)) + "\n")
+
+    async def write(self, s): pass
+
+    async def write_err(self, s): await self.write(s)
+
+    async def read_line(self, prompt=""): return ""
+
+    async def read_pass(self, prompt=""): return await self.read_line(prompt)
+
+    async def exit_term(self): pass
+
+
+class AsyncCmdTerm(AsyncBaseTerm):
+    """
+    console terminal, input() runs in the default executor so that the event
+    loop keeps serving other sessions while waiting for the operator
+    """
+    async def read_line(self, prompt=""):
+        return await asyncio.get_running_loop().run_in_executor(None, input, prompt)
+
+    async def write(self, s):
+        sys.stdout.write(s)
+        sys.stdout.flush()
+
+    async def write_err(self, s):
+        sys.stderr.write(s)
+        sys.stderr.flush()
+
+
+class AsyncStreamTerm(AsyncBaseTerm):
+    """
+    terminal over an asyncio (StreamReader, StreamWriter) pair
+    read_line raises EOFError once the peer has closed its end
+    """
+    def __init__(self, reader, writer, encoding="utf-8"):
+        self.reader = reader
+        self.writer = writer
+        self.encoding = encoding
+
+    async def read_line(self, prompt=""):
+        if prompt:
+            await self.write(prompt)
+        line = await self.reader.readline()
+        if not line:
+            raise EOFError("connection closed")
+        return line.decode(self.encoding, "replace").rstrip("\r\n")
+
+    async def write(self, s):
+        self.writer.write(s.encode(self.encoding, "replace"))
+        await self.writer.drain()
+
+    async def exit_term(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class SyncTermProxy(BaseTerm):
+    """
+    BaseTerm facade over an AsyncBaseTerm, lets blocking ShellCmd instances
+    running in an executor thread talk to a terminal owned by the event loop
+    must not be used from the event loop thread itself (it would deadlock)
+    """
+    def __init__(self, term_obj, loop):
+        self.term_obj = term_obj
+        self.loop = loop
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def out_ln(self, *args):
+        self._call(self.term_obj.out_ln(*args))
+
+    def out_ln_lk(self, *args):
+        self.out_ln(*args)
+
+    def write(self, s):
+        self._call(self.term_obj.write(s))
+
+    def write_lk(self, s):
+        self.write(s)
+
+    def write_err(self, s):
+        self._call(self.term_obj.write_err(s))
+
+    def write_err_lk(self, s):
+        self.write_err(s)
+
+    def read_line(self, prompt=""):
+        return self._call(self.term_obj.read_line(prompt))
+
+    def read_pass(self, prompt=""):
+        return self._call(self.term_obj.read_pass(prompt))
+
+    def exit_term(self):
+        self._call(self.term_obj.exit_term())
+
+
+class AsyncShellCmd(ShellCmd):
+    async def __call__(self, term_obj, shared_env, local_env, cmdline):
+        await term_obj.write("This command is using default __call__ (does nothing but print this)\n")
+
+
+class AsyncParsingShellCmd(AsyncShellCmd):
+    def __init__(self, name, func, max_uni_lvl=2):
+        super(AsyncParsingShellCmd, self).__init__(name, func)
+        self.max_uni_lvl = max_uni_lvl
+
+    async def __call__(self, term_obj, shared_env, local_env, cmdline):
+        await self.func(term_obj, shared_env, local_env, parse_cmdline(cmdline, self.max_uni_lvl))
+
+
+class AsyncPlainShellCmd(AsyncShellCmd):
+    async def __call__(self, term_obj, shared_env, local_env, cmdline):
+        await self.func(term_obj, shared_env, local_env, cmdline)
+
+
+def is_async_cmd(cmd):
+    return isinstance(cmd, AsyncShellCmd) or inspect.iscoroutinefunction(cmd)
+
+
+def split_cmd_line(line):
+    """
+    :param str line:
+    :return: (command name, rest of the command line) or None for a blank line
+    :rtype: (str, str)|None
+    """
+    parts = line.strip().split(None, 1)
+    if not parts:
+        return None
+    return parts[0], parts[1] if len(parts) > 1 else ""
+
+
+class AsyncDictCmdShell(DictCmdShell):
+    """
+    DictCmdShell whose dispatch is a coroutine. Async commands (AsyncShellCmd
+    instances or coroutine functions) are awaited on the event loop, any
+    other callable (the existing ShellCmd subclasses) runs in executor with a
+    SyncTermProxy standing in for the terminal.
+    max_concurrency bounds the number of commands running at the same time
+    across every session served by this shell.
+    Latency of blocking commands includes time spent waiting for an executor
+    thread, profiling (enable_profiling) only applies to blocking commands.
+    term_obj is the (blocking) BaseTerm written to by man_cmd style commands,
+    e.g. a SyncTermProxy or a SockTermServer.
+    A trailing '&' runs blocking commands as jobs in the job pool (see
+    DictCmdShell.submit_job) and spawns coroutine commands as tasks, which
+    jobs/wait/cancel do not track.
+    """
+    def __init__(self, dct_cmds, shared_dat, local_env, use_lower, executor=None, max_concurrency=None,
+                 term_obj=None, max_jobs=4, max_finished_jobs=64):
+        super(AsyncDictCmdShell, self).__init__(
+            dct_cmds, shared_dat, local_env, use_lower, term_obj, max_jobs, max_finished_jobs)
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.sem = None
+        self.bg_tasks = set()
+
+    async def dispatch(self, term_obj, cmd, cmdline, background=False):
+        if not background:
+            cmd, cmdline, background = split_background(cmd, cmdline)
+        if self.use_lower:
+            cmd = cmd.lower()
+        if cmd not in self.dct_cmds:
+            await term_obj.write("Unrecognized Command '%s', type help for a list of commands\n" % cmd)
+            return
+        if background:
+            if is_async_cmd(self.dct_cmds[cmd]):
+                await term_obj.write("[task] %s\n" % cmd)
+                task = asyncio.ensure_future(self._dispatch_cmd(term_obj, cmd, cmdline))
+                self.bg_tasks.add(task)
+                task.add_done_callback(self.bg_tasks.discard)
+                return
+            proxy = SyncTermProxy(term_obj, asyncio.get_running_loop())
+            # submit_job writes its announcement through the proxy
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.submit_job, proxy, cmd, cmdline)
+        await self._dispatch_cmd(term_obj, cmd, cmdline)
+
+    async def _dispatch_cmd(self, term_obj, cmd, cmdline):
+        if self.max_concurrency is not None and self.sem is None:
+            self.sem = asyncio.Semaphore(self.max_concurrency)
+        if self.sem is None:
+            await self._run_cmd(term_obj, cmd, cmdline)
+        else:
+            async with self.sem:
+                await self._run_cmd(term_obj, cmd, cmdline)
+
+    async def _run_cmd(self, term_obj, name, cmdline):
+        cmd = self.dct_cmds[name]
+        failed = False
+        start = time.perf_counter()
+        # noinspection PyBroadException
+        try:
+            if is_async_cmd(cmd):
+                await cmd(term_obj, self.shared_env, self.env_dat, cmdline)
+            else:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self.executor, functools.partial(
+                    self.call_cmd, name, cmd, SyncTermProxy(term_obj, loop), cmdline))
+        except Exception as exc:
+            del exc
+            failed = True
+            await term_obj.write(traceback.format_exc())
+        self.record_cmd(name, time.perf_counter() - start, failed)
+
+    def spawn(self, term_obj, cmd, cmdline):
+        """
+        schedules a command without waiting for it
+        :rtype: asyncio.Task
+        """
+        return asyncio.ensure_future(self.dispatch(term_obj, cmd, cmdline))
+
+    async def run_session(self, term_obj, prompt="> ", exit_cmds=("exit", "quit")):
+        """
+        reads and dispatches command lines from term_obj until one of
+        exit_cmds is entered or the terminal reaches end of input
+        """
+        try:
+            while True:
+                try:
+                    line = await term_obj.read_line(prompt)
+                except EOFError:
+                    break
+                parts = split_cmd_line(line)
+                if parts is None:
+                    continue
+                cmd, cmdline = parts
+                if (cmd.lower() if self.use_lower else cmd) in exit_cmds:
+                    break
+                await self.dispatch(term_obj, cmd, cmdline)
+        finally:
+            await term_obj.exit_term()
+
+
+class SockConnTerm(AsyncStreamTerm):
+    """
+    one client connection of a SockTermServer
+    writes from the session await the transport draining below its high
+    water mark, broadcast posts never wait and are dropped (and counted)
+    once more than max_buffer bytes are queued for this client
+    """
+    def __init__(self, reader, writer, max_buffer, encoding="utf-8"):
+        super(SockConnTerm, self).__init__(reader, writer, encoding)
+        self.max_buffer = max_buffer
+        self.num_dropped = 0
+
+    @property
+    def buffered(self):
+        return self.writer.transport.get_write_buffer_size()
+
+    def post(self, s):
+        if self.writer.is_closing():
+            return
+        if self.buffered > self.max_buffer:
+            self.num_dropped += 1
+            return
+        self.writer.write(s.encode(self.encoding, "replace"))
+
+
+class SockTermServer(BaseTerm):
+    """
+    serves AsyncDictCmdShell sessions to TCP or Unix socket clients from a
+    single event loop, one SockConnTerm per client
+    shell_factory(conn_term) returns the shell for a new session, so sessions
+    may share one shell or get their own local_env
+    as a BaseTerm it broadcasts to every connected client and may be added to
+    a PrnTermGroup; these writes are thread safe and never block
+    """
+    def __init__(self, shell_factory, prompt="> ", max_buffer=1 << 16, high_water=1 << 15, encoding="utf-8"):
+        self.shell_factory = shell_factory
+        self.prompt = prompt
+        self.max_buffer = max_buffer
+        self.high_water = high_water
+        self.encoding = encoding
+        self.conns = set()
+        self.servers = []
+        self.loop = None
+
+    async def start_tcp(self, host, port, **kwargs):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._handle_conn, host, port, **kwargs)
+        self.servers.append(server)
+        return server
+
+    async def start_unix(self, path, **kwargs):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_unix_server(self._handle_conn, path, **kwargs)
+        self.servers.append(server)
+        return server
+
+    async def _handle_conn(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=self.high_water)
+        conn = SockConnTerm(reader, writer, self.max_buffer, self.encoding)
+        self.conns.add(conn)
+        try:
+            await self.shell_factory(conn).run_session(conn, self.prompt)
+        except ConnectionError:
+            pass
+        finally:
+            self.conns.discard(conn)
+            writer.close()
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+        for conn in list(self.conns):
+            await conn.exit_term()
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers = []
+
+    def _broadcast(self, s):
+        for conn in list(self.conns):
+            conn.post(s)
+
+    def write(self, s):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._broadcast, s)
+
+    def write_lk(self, s):
+        self.write(s)
+
+    def out_ln(self, *args):
+        self.write(" ".join(map(str, args)) + "\n")
+
+    def out_ln_lk(self, *args):
+        self.out_ln(*args)
+
+    def read_line(self, prompt=""):
+        raise NotImplementedError("read_line is not useable on SockTermServer instances")
+
+    def exit_term(self):
+        if self.loop is not None and not self.loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.close(), self.loop)
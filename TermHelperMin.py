@@ -1,6 +1,14 @@
+import cProfile
+import io
+import pstats
+import random
 import threading
 import sys
+import time
 import traceback
+from bisect import bisect_left
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import deque
 from CmdLineIface import parse_cmdline
 
 try:
@@ -125,29 +133,282 @@ class PrnTermGroup(BaseTerm):
         raise NotImplementedError("read_line is not useable on PrnTermGroup instances")
 
 
-class PseudoStdout(object):
-    def __init__(self, term_obj):
+FAN_OUT_BLOCK = "block"
+FAN_OUT_DROP_NEWEST = "drop-newest"
+FAN_OUT_DROP_OLDEST = "drop-oldest"
+
+
+class FanOutTermWorker(object):
+    """
+    Owns the bounded queue and worker thread feeding one member terminal of a
+    FanOutTermGroup. Counters are only approximate while the worker is busy.
+    """
+    def __init__(self, term_obj, max_queue, policy):
+        assert policy in {FAN_OUT_BLOCK, FAN_OUT_DROP_NEWEST, FAN_OUT_DROP_OLDEST}
+        self.term_obj = term_obj
+        self.max_queue = max_queue
+        self.policy = policy
+        self.queue = deque()
+        self.cond = threading.Condition(threading.Lock())
+        self.closed = False
+        self.busy = False
+        self.num_written = 0
+        self.num_dropped = 0
+        self.num_errors = 0
+        self.max_lag = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @property
+    def lag(self):
+        return len(self.queue)
+
+    def put(self, method, args):
+        with self.cond:
+            if self.closed:
+                return False
+            if self.max_queue and len(self.queue) >= self.max_queue:
+                if self.policy == FAN_OUT_DROP_NEWEST:
+                    self.num_dropped += 1
+                    return False
+                elif self.policy == FAN_OUT_DROP_OLDEST:
+                    self.queue.popleft()
+                    self.num_dropped += 1
+                else:
+                    while not self.closed and len(self.queue) >= self.max_queue:
+                        self.cond.wait()
+                    if self.closed:
+                        return False
+            self.queue.append((method, args))
+            if len(self.queue) > self.max_lag:
+                self.max_lag = len(self.queue)
+            self.cond.notify_all()
+        return True
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                method, args = self.queue.popleft()
+                self.busy = True
+                self.cond.notify_all()
+            # noinspection PyBroadException
+            try:
+                getattr(self.term_obj, method)(*args)
+                self.num_written += 1
+            except Exception:
+                self.num_errors += 1
+            with self.cond:
+                self.busy = False
+                self.cond.notify_all()
+
+    def join(self, timeout=None):
+        """
+        waits until everything queued so far has been written
+        :param float|None timeout:
+        :rtype: bool
+        """
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.queue and not self.busy, timeout)
+
+    def close(self, discard=False):
+        """
+        stops accepting writes, the worker exits once the queue has drained
+        (or immediately after the current write when discard is True)
+        """
+        with self.cond:
+            self.closed = True
+            if discard:
+                self.num_dropped += len(self.queue)
+                self.queue.clear()
+            self.cond.notify_all()
+
+    def get_stats(self):
+        return {
+            "lag": self.lag, "max_lag": self.max_lag, "written": self.num_written,
+            "dropped": self.num_dropped, "errors": self.num_errors}
+
+
+class FanOutTermGroup(PrnTermGroup):
+    """
+    PrnTermGroup where every member terminal gets its own bounded queue and
+    worker thread so that a slow terminal (remote or file backed) stalls
+    neither the producers nor the other members.
+
+    policy decides what happens when a member's queue already holds
+    max_queue writes: FAN_OUT_BLOCK waits for room, FAN_OUT_DROP_NEWEST
+    discards the new write and FAN_OUT_DROP_OLDEST discards the oldest
+    queued write. max_queue of 0 means unbounded.
+    """
+    def __init__(self, lst_terms, max_queue=1024, policy=FAN_OUT_BLOCK):
+        self.max_queue = max_queue
+        self.policy = policy
+        self.workers = {}
+        super(FanOutTermGroup, self).__init__(lst_terms)
+        for term_obj in self.Terms:
+            self.workers[term_obj] = FanOutTermWorker(term_obj, max_queue, policy)
+
+    def add_term(self, term_obj):
+        with self.lk:
+            if term_obj in self.workers:
+                return
+            self.Terms.add(term_obj)
+            self.workers[term_obj] = FanOutTermWorker(term_obj, self.max_queue, self.policy)
+
+    def remove_term(self, term_obj, discard=False):
+        with self.lk:
+            self.Terms.discard(term_obj)
+            worker = self.workers.pop(term_obj, None)
+        if worker is not None:
+            worker.close(discard)
+
+    def _put_all(self, method, args):
+        with self.lk:
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker.put(method, args)
+
+    def out_ln(self, *args):
+        self._put_all("out_ln_lk", args)
+
+    def out_ln_lk(self, *args):
+        self._put_all("out_ln_lk", args)
+
+    def write(self, s):
+        self._put_all("write_lk", (s,))
+
+    def write_lk(self, s):
+        self._put_all("write_lk", (s,))
+
+    def write_err(self, s):
+        self._put_all("write_err_lk", (s,))
+
+    def write_err_lk(self, s):
+        self._put_all("write_err_lk", (s,))
+
+    def flush(self, timeout=None):
+        """
+        waits until every member terminal has caught up
+        :param float|None timeout: applied to each member in turn
+        :rtype: bool
+        """
+        with self.lk:
+            workers = list(self.workers.values())
+        rtn = True
+        for worker in workers:
+            rtn = worker.join(timeout) and rtn
+        return rtn
+
+    def get_lag_stats(self):
+        """
+        :rtype: dict[BaseTerm,dict[str,int]]
+        """
+        with self.lk:
+            workers = list(self.workers.items())
+        return {term_obj: worker.get_stats() for term_obj, worker in workers}
+
+    def exit_term(self):
+        with self.lk:
+            workers = list(self.workers.values())
+            self.workers.clear()
+            self.Terms.clear()
+        for worker in workers:
+            worker.close()
+
+
+class PseudoStdout(io.TextIOBase):
+    """
+    File-like redirect target (e.g. for sys.stdout) that forwards flushed
+    text to term_obj.write_lk.
+
+    Pending writes are kept as a list of chunks and joined once per flush.
+    LstWritten keeps the most recently flushed chunks, bounded by
+    max_written_entries and max_written_chars (None disables a limit).
+    With line_buffering set, a write containing a newline flushes.
+    """
+    def __init__(self, term_obj, max_written_entries=1024, max_written_chars=1 << 20, line_buffering=False):
+        super(PseudoStdout, self).__init__()
         assert isinstance(term_obj, BaseTerm)
         self.term_obj = term_obj
-        self.LstWritten = []
-        self.Buffer = ""
+        self.max_written_entries = max_written_entries
+        self.max_written_chars = max_written_chars
+        self.line_buffering = line_buffering
+        self.LstWritten = deque()
+        self.written_chars = 0
+        self.lst_pending = []
+        self.lk = threading.RLock()
+
+    @property
+    def Buffer(self):
+        with self.lk:
+            return "".join(self.lst_pending)
+
+    def readable(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
 
     def write(self, data):
-        self.Buffer += data
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        if not isinstance(data, str):
+            raise TypeError("write() argument must be str, not %s" % type(data).__name__)
+        with self.lk:
+            self.lst_pending.append(data)
+            if self.line_buffering and "\n" in data:
+                self.flush()
+        return len(data)
+
+    def writelines(self, lines):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        with self.lk:
+            has_newline = False
+            for line in lines:
+                if not isinstance(line, str):
+                    raise TypeError("write() argument must be str, not %s" % type(line).__name__)
+                self.lst_pending.append(line)
+                has_newline = has_newline or "\n" in line
+            if self.line_buffering and has_newline:
+                self.flush()
 
     def flush(self):
-        self.LstWritten.append(self.Buffer)
-        self.term_obj.write_lk(self.Buffer)
-        self.Buffer = ""
+        with self.lk:
+            if not self.lst_pending:
+                return
+            data = "".join(self.lst_pending)
+            self.lst_pending = []
+            self._add_written(data)
+            self.term_obj.write_lk(data)
+
+    def _add_written(self, data):
+        self.LstWritten.append(data)
+        self.written_chars += len(data)
+        max_entries = self.max_written_entries
+        max_chars = self.max_written_chars
+        while self.LstWritten and (
+                (max_entries is not None and len(self.LstWritten) > max_entries) or
+                (max_chars is not None and self.written_chars > max_chars)):
+            self.written_chars -= len(self.LstWritten.popleft())
 
     def read(self, num=None):
-        raise IOError("File not open for reading")
+        raise io.UnsupportedOperation("File not open for reading")
+
+    def readline(self, size=-1):
+        raise io.UnsupportedOperation("File not open for reading")
 
     def seek(self, offset, whence=0):
-        pass
+        raise io.UnsupportedOperation("File not seekable")
 
     def tell(self):
-        return 0
+        raise io.UnsupportedOperation("File not seekable")
 
 
 class BaseCmdShell(object):
@@ -182,9 +443,193 @@ class RtnNoEnvShellCmd(ShellCmd):
         term_obj.write(self.func(cmdline) + "\n")
 
 
+# upper bounds (seconds) of the latency histogram buckets, 1us to ~4000s in
+# steps of 25% so that reported percentiles are within 25% of the real value
+LATENCY_BUCKETS = [1e-6 * 1.25 ** i for i in range(100)]
+
+
+class CmdStats(object):
+    def __init__(self):
+        self.lk = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lk:
+            self.calls = 0
+            self.errors = 0
+            self.total_time = 0.0
+            self.max_time = 0.0
+            self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, elapsed, failed):
+        i = bisect_left(LATENCY_BUCKETS, elapsed)
+        with self.lk:
+            self.calls += 1
+            if failed:
+                self.errors += 1
+            self.total_time += elapsed
+            if elapsed > self.max_time:
+                self.max_time = elapsed
+            self.buckets[i] += 1
+
+    def percentile(self, pct):
+        """
+        :param float pct: 0 to 100
+        :return: upper bound of the bucket holding the pct-th percentile latency
+        :rtype: float
+        """
+        with self.lk:
+            target = self.calls * pct / 100.0
+            seen = 0
+            for i, num in enumerate(self.buckets):
+                seen += num
+                if num and seen >= target:
+                    return min(LATENCY_BUCKETS[i], self.max_time) if i < len(LATENCY_BUCKETS) else self.max_time
+            return 0.0
+
+    def get_summary(self):
+        return {
+            "calls": self.calls, "errors": self.errors,
+            "mean": self.total_time / self.calls if self.calls else 0.0,
+            "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99),
+            "max": self.max_time}
+
+
+# only one cProfile profiler may be active per interpreter (Python 3.12+),
+# so at most one sampled call is profiled at a time across all shells
+PROFILE_LK = threading.Lock()
+
+
+class CmdProfile(object):
+    """
+    samples roughly sample_rate of the calls to one command with cProfile and
+    accumulates the results in stats (a pstats.Stats, None until the first
+    sampled call)
+    a sampled call that overlaps another profiled call runs unprofiled
+    """
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self.num_sampled = 0
+        self.stats = None
+        self.lk = threading.Lock()
+
+    def sample(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def runcall(self, func, *args):
+        if not PROFILE_LK.acquire(False):
+            return func(*args)
+        try:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                # another profiling tool is active
+                return func(*args)
+            try:
+                return func(*args)
+            finally:
+                prof.disable()
+                self._add_profile(prof)
+        finally:
+            PROFILE_LK.release()
+
+    def _add_profile(self, prof):
+        with self.lk:
+            self.num_sampled += 1
+            if self.stats is None:
+                self.stats = pstats.Stats(prof)
+            else:
+                self.stats.add(prof)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobTerm(BaseTerm):
+    """
+    terminal handed to a background job, output goes straight to the shell's
+    terminal through the locked writes; once the job is cancelled every write
+    raises JobCancelled so that commands stop at their next output
+    """
+    def __init__(self, term_obj):
+        self.term_obj = term_obj
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def _check(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def out_ln(self, *args):
+        self._check()
+        self.term_obj.out_ln_lk(*args)
+
+    def out_ln_lk(self, *args):
+        self.out_ln(*args)
+
+    def write(self, s):
+        self._check()
+        self.term_obj.write_lk(s)
+
+    def write_lk(self, s):
+        self.write(s)
+
+    def write_err(self, s):
+        self._check()
+        self.term_obj.write_err_lk(s)
+
+    def write_err_lk(self, s):
+        self.write_err(s)
+
+    def read_line(self, prompt=""):
+        raise NotImplementedError("read_line is not useable from a background job")
+
+
+class ShellJob(object):
+    def __init__(self, job_id, name, cmdline, term_obj):
+        self.job_id = job_id
+        self.name = name
+        self.cmdline = cmdline
+        self.term_obj = term_obj
+        self.future = None
+        self.started = False
+        self.failed = False
+
+    @property
+    def status(self):
+        if self.future.cancelled() or self.term_obj.cancelled and self.future.done():
+            return "Cancelled"
+        if self.future.done():
+            return "Error" if self.failed else "Done"
+        return "Running" if self.started else "Pending"
+
+
+def split_background(cmd, cmdline):
+    """
+    strips a trailing '&' (run in background) from a command line, an escaped
+    trailing '\\&' is passed on to the command as a literal '&'
+    :param str cmd:
+    :param str cmdline:
+    :rtype: (str, str, bool)
+    """
+    if cmdline.rstrip().endswith("\\&"):
+        return cmd, cmdline.rstrip()[:-2] + "&", False
+    elif cmdline.rstrip().endswith("&"):
+        return cmd, cmdline.rstrip()[:-1].rstrip(), True
+    elif len(cmdline.strip()) == 0 and len(cmd) > 1 and cmd.endswith("&"):
+        return cmd[:-1], cmdline, True
+    return cmd, cmdline, False
+
+
 class DictCmdShell(BaseCmdShell):
     # TODO: allow include command dictionary 'dct_cmds' in the class definition
-    def __init__(self, dct_cmds, shared_dat, local_env, use_lower):
+    def __init__(self, dct_cmds, shared_dat, local_env, use_lower, term_obj=None, max_jobs=4,
+                 max_finished_jobs=64):
         assert isinstance(dct_cmds, dict)
         for k in dct_cmds:
             assert isinstance(k, str)
@@ -195,21 +640,194 @@ class DictCmdShell(BaseCmdShell):
         self.env_dat = dict() if local_env is None else local_env
         self.shared_env = shared_dat
         self.use_lower = use_lower
-
-    def dispatch(self, term_obj, cmd, cmdline):
+        self.term_obj = term_obj
+        self.cmd_stats = {}
+        self.profile_cmds = {}
+        self.stats_lk = threading.Lock()
+        self.max_jobs = max_jobs
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = {}
+        self.finished_jobs = deque()
+        self.next_job_id = 1
+        self.jobs_lk = threading.Lock()
+        self.job_pool = None
+
+    def dispatch(self, term_obj, cmd, cmdline, background=False):
+        """
+        runs a command, a trailing '&' on the command line (or background)
+        submits it to the job pool instead and returns its job id
+        :rtype: int|None
+        """
+        if not background:
+            cmd, cmdline, background = split_background(cmd, cmdline)
         if self.use_lower:
             cmd = cmd.lower()
         if cmd not in self.dct_cmds:
             term_obj.write("Unrecognized Command '%s', type help for a list of commands" % cmd)
             return
+        if background:
+            return self.submit_job(term_obj, cmd, cmdline)
+        name = cmd
         cmd = self.dct_cmds[cmd]
+        failed = False
+        start = time.perf_counter()
         # assert isinstance(Cmd, ShellCmd) and callable(Cmd)
         # noinspection PyBroadException
         try:
-            cmd(term_obj, self.shared_env, self.env_dat, cmdline)
+            self.call_cmd(name, cmd, term_obj, cmdline)
         except Exception as exc:
             del exc
+            failed = True
             term_obj.write(traceback.format_exc())
+        self.record_cmd(name, time.perf_counter() - start, failed)
+
+    def call_cmd(self, name, cmd, term_obj, cmdline):
+        prof = self.profile_cmds.get(name)
+        if prof is None or not prof.sample():
+            return cmd(term_obj, self.shared_env, self.env_dat, cmdline)
+        return prof.runcall(cmd, term_obj, self.shared_env, self.env_dat, cmdline)
+
+    def record_cmd(self, name, elapsed, failed):
+        stats = self.cmd_stats.get(name)
+        if stats is None:
+            with self.stats_lk:
+                stats = self.cmd_stats.setdefault(name, CmdStats())
+        stats.record(elapsed, failed)
+
+    def submit_job(self, term_obj, name, cmdline):
+        """
+        runs the command name in the bounded job pool (max_jobs threads),
+        jobs beyond that wait in the pool's queue as Pending
+        finished jobs stay in the job table until reported by list_jobs or
+        collected by wait_job, at most max_finished_jobs of them are kept
+        :rtype: int
+        """
+        with self.jobs_lk:
+            job = ShellJob(self.next_job_id, name, cmdline, JobTerm(term_obj))
+            self.next_job_id += 1
+        # announced before submitting so it always precedes the job's output
+        term_obj.write_lk("[%d] %s\n" % (job.job_id, name))
+        with self.jobs_lk:
+            if self.job_pool is None:
+                self.job_pool = ThreadPoolExecutor(self.max_jobs, thread_name_prefix="ShellJob")
+            self.jobs[job.job_id] = job
+            job.future = self.job_pool.submit(self._run_job, job)
+        job.future.add_done_callback(lambda future: self._job_finished(job.job_id))
+        return job.job_id
+
+    def _job_finished(self, job_id):
+        with self.jobs_lk:
+            if job_id not in self.jobs:
+                return
+            self.finished_jobs.append(job_id)
+            while len(self.finished_jobs) > self.max_finished_jobs:
+                self.jobs.pop(self.finished_jobs.popleft(), None)
+
+    def _forget_jobs(self, lst_ids):
+        # caller holds jobs_lk
+        for job_id in lst_ids:
+            self.jobs.pop(job_id, None)
+        self.finished_jobs = deque(x for x in self.finished_jobs if x in self.jobs)
+
+    def _run_job(self, job):
+        job.started = True
+        term_obj = job.term_obj
+        start = time.perf_counter()
+        # noinspection PyBroadException
+        try:
+            self.call_cmd(job.name, self.dct_cmds[job.name], term_obj, job.cmdline)
+        except JobCancelled:
+            pass
+        except Exception as exc:
+            del exc
+            job.failed = True
+            term_obj.term_obj.write_lk(traceback.format_exc())
+        self.record_cmd(job.name, time.perf_counter() - start, job.failed)
+        if term_obj.cancelled:
+            status = "Cancelled"
+        else:
+            status = "Error" if job.failed else "Done"
+        term_obj.term_obj.write_lk("[%d] %s %s\n" % (job.job_id, status, job.name))
+
+    def get_job(self, job_id):
+        with self.jobs_lk:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self, forget_finished=False):
+        """
+        :param bool forget_finished: drop the finished jobs from the table once listed
+        :rtype: list[ShellJob]
+        """
+        with self.jobs_lk:
+            jobs = [self.jobs[k] for k in sorted(self.jobs)]
+            if forget_finished:
+                self._forget_jobs([job.job_id for job in jobs if job.future.done()])
+        return jobs
+
+    def wait_job(self, job_id, timeout=None):
+        """
+        :return: False if the job is unknown or still running after timeout
+        :rtype: bool
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            # finished jobs may already have been reported or dropped
+            return 0 < job_id < self.next_job_id
+        try:
+            job.future.exception(timeout)
+        except CancelledError:
+            pass
+        except FutureTimeoutError:
+            return False
+        with self.jobs_lk:
+            self._forget_jobs([job_id])
+        return True
+
+    def cancel_job(self, job_id):
+        """
+        pending jobs never start, running jobs get JobCancelled raised at
+        their next write to the terminal (or may poll term_obj.cancelled)
+        :rtype: bool
+        """
+        job = self.get_job(job_id)
+        if job is None or job.future.done():
+            return False
+        job.term_obj.cancel_event.set()
+        job.future.cancel()
+        return True
+
+    def shutdown_jobs(self, wait=True):
+        with self.jobs_lk:
+            pool = self.job_pool
+            self.job_pool = None
+            jobs = list(self.jobs.values())
+        if not wait:
+            for job in jobs:
+                self.cancel_job(job.job_id)
+        if pool is not None:
+            pool.shutdown(wait)
+
+    def enable_profiling(self, name, sample_rate=1.0):
+        """
+        starts profiling the command name (keeping what was collected so far)
+        :param str name:
+        :param float sample_rate: fraction of the calls to profile
+        """
+        with self.stats_lk:
+            prof = self.profile_cmds.get(name)
+            if prof is None:
+                self.profile_cmds[name] = CmdProfile(sample_rate)
+            else:
+                prof.sample_rate = sample_rate
+
+    def disable_profiling(self, name):
+        """
+        :return: the collected profile or None
+        :rtype: pstats.Stats|None
+        """
+        with self.stats_lk:
+            prof = self.profile_cmds.pop(name, None)
+        return None if prof is None else prof.stats
 
 
 def man_cmd(shell, args):
@@ -228,6 +846,110 @@ def man_cmd(shell, args):
         shell.term_obj.write("man %s:\n%s\n" % (args[0], func.man_page))
 
 
+def stats_cmd(shell, args):
+    if len(args) == 1 and args[0].lower() == "reset":
+        for stats in list(shell.cmd_stats.values()):
+            stats.reset()
+        shell.term_obj.write("command statistics reset\n")
+        return
+    names = [x.lower() if shell.use_lower else x for x in args]
+    if len(names) == 0:
+        names = sorted(shell.cmd_stats)
+    lst_lines = ["%-16s %8s %8s %10s %10s %10s %10s %10s" % (
+        "command", "calls", "errors", "mean(ms)", "p50(ms)", "p95(ms)", "p99(ms)", "max(ms)")]
+    for name in names:
+        if name not in shell.cmd_stats:
+            lst_lines.append("%-16s no calls recorded" % name)
+            continue
+        summary = shell.cmd_stats[name].get_summary()
+        lst_lines.append("%-16s %8d %8d %10.3f %10.3f %10.3f %10.3f %10.3f" % (
+            name, summary["calls"], summary["errors"], summary["mean"] * 1000, summary["p50"] * 1000,
+            summary["p95"] * 1000, summary["p99"] * 1000, summary["max"] * 1000))
+    shell.term_obj.write("\n".join(lst_lines) + "\n")
+
+
+def profile_cmd(shell, args):
+    usage = "Usage: profile <command> on [sample_rate] | off | show [num_lines]\n"
+    if len(args) < 2:
+        shell.term_obj.write(usage)
+        return
+    cmd = args[0].lower() if shell.use_lower else args[0]
+    action = args[1].lower()
+    if cmd not in shell.dct_cmds:
+        shell.term_obj.write("profile could not find the command %s\n" % args[0])
+    elif action == "on":
+        try:
+            sample_rate = float(args[2]) if len(args) > 2 else 1.0
+        except ValueError:
+            shell.term_obj.write(usage)
+            return
+        if not sample_rate > 0:
+            shell.term_obj.write("profile: sample_rate must be greater than 0\n")
+            return
+        shell.enable_profiling(cmd, sample_rate)
+        shell.term_obj.write("profiling %s\n" % args[0])
+    elif action == "off":
+        shell.disable_profiling(cmd)
+        shell.term_obj.write("stopped profiling %s\n" % args[0])
+    elif action == "show":
+        try:
+            num_lines = int(args[2]) if len(args) > 2 else 20
+        except ValueError:
+            shell.term_obj.write(usage)
+            return
+        prof = shell.profile_cmds.get(cmd)
+        if prof is None or prof.stats is None:
+            shell.term_obj.write("no profile collected for %s\n" % args[0])
+            return
+        stream = io.StringIO()
+        with prof.lk:
+            prof.stats.stream = stream
+            prof.stats.sort_stats("cumulative").print_stats(num_lines)
+        shell.term_obj.write("profile %s (%d sampled calls):\n%s" % (args[0], prof.num_sampled, stream.getvalue()))
+    else:
+        shell.term_obj.write(usage)
+
+
+def jobs_cmd(shell, args):
+    del args
+    lst_jobs = shell.list_jobs(True)
+    if len(lst_jobs) == 0:
+        shell.term_obj.write("no jobs\n")
+        return
+    shell.term_obj.write("".join(
+        "[%d] %-10s %s %s\n" % (job.job_id, job.status, job.name, job.cmdline) for job in lst_jobs))
+
+
+def wait_cmd(shell, args):
+    if len(args) == 0:
+        lst_ids = [job.job_id for job in shell.list_jobs()]
+    else:
+        try:
+            lst_ids = [int(x.lstrip("%")) for x in args]
+        except ValueError:
+            shell.term_obj.write("Usage: wait [job_id ...]\n")
+            return
+    for job_id in lst_ids:
+        if not shell.wait_job(job_id):
+            shell.term_obj.write("wait could not find the job %d\n" % job_id)
+
+
+def cancel_cmd(shell, args):
+    if len(args) == 0:
+        shell.term_obj.write("Must have a job id to cancel\n")
+        return
+    for arg in args:
+        try:
+            job_id = int(arg.lstrip("%"))
+        except ValueError:
+            shell.term_obj.write("cancel: %s is not a job id\n" % arg)
+            continue
+        if shell.cancel_job(job_id):
+            shell.term_obj.write("[%d] cancelling\n" % job_id)
+        else:
+            shell.term_obj.write("cancel could not find a running job %d\n" % job_id)
+
+
 class PythonRunner(object):
     def __init__(self, globs, locs, ps1, ps2):
         self.globs = globs